@@ -1,6 +1,8 @@
 """
 ARQ worker runner — works around Python 3.14 asyncio.get_event_loop() removal.
 
+Runs on uvloop when it is installed (it isn't available on Windows).
+
 Usage:  uv run python run_worker.py
 """
 
@@ -10,8 +12,13 @@ from arq.worker import create_worker
 
 from src.worker import WorkerSettings
 
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 if __name__ == "__main__":
-    loop = asyncio.new_event_loop()
+    loop = uvloop.new_event_loop() if uvloop else asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
     worker = create_worker(WorkerSettings)
     worker.run()
@@ -1,10 +1,34 @@
+import asyncio
 from typing_extensions import TypedDict
 from typing import Literal
 
 from agents import function_tool
+from cachetools import TTLCache
 import httpx
 
 from src.config import OPENWEATHERMAP_API_KEY
+from src.utils.http_clients import weather_client
+
+# OpenWeatherMap only refreshes its data every ~10 minutes, so successful
+# lookups are cached per (city, unit) for a few minutes
+WEATHER_CACHE_TTL = 300
+_weather_cache: TTLCache[tuple[str, str], str] = TTLCache(maxsize=1024, ttl=WEATHER_CACHE_TTL)
+_weather_locks: dict[tuple[str, str], asyncio.Lock] = {}
+
+# Display units for each OpenWeatherMap unit system
+TEMP_UNITS = {"metric": "°C", "imperial": "°F", "standard": "K"}
+WIND_UNITS = {"metric": "m/s", "imperial": "mph", "standard": "m/s"}
+
+WEATHER_TEMPLATE = """Weather in {city_name}, {country}:
+🌡️ Temperature: {temp}{temp_unit} (feels like {feels_like}{temp_unit})
+☁️ Conditions: {description}
+💧 Humidity: {humidity}%
+💨 Wind Speed: {wind_speed} {wind_unit}"""
+
+HTTP_ERROR_MESSAGES = {
+    404: "Error: City '{city}' not found. Please check the spelling or try a different city.",
+    401: "Error: Invalid API key. Please check your OpenWeatherMap API key.",
+}
 
 
 class Location(TypedDict):
@@ -12,6 +36,47 @@ class Location(TypedDict):
     unit: Literal["metric", "imperial", "standard"]
 
 
+async def _get_weather_report(city: str, unit: str) -> str:
+    """
+    Fetch and format the weather report for a city, serving repeat lookups from cache.
+
+    HTTP and parsing errors propagate to the caller and are never cached.
+    """
+    cache_key = (city.lower(), unit)
+
+    report = _weather_cache.get(cache_key)
+    if report is not None:
+        return report
+
+    # Only one request per city/unit is in flight; concurrent callers wait for it
+    lock = _weather_locks.setdefault(cache_key, asyncio.Lock())
+    try:
+        async with lock:
+            report = _weather_cache.get(cache_key)
+            if report is None:
+                params = {"q": city, "appid": OPENWEATHERMAP_API_KEY, "units": unit}
+                response = await weather_client.get("/data/2.5/weather", params=params)
+                response.raise_for_status()
+                data = response.json()
+
+                report = WEATHER_TEMPLATE.format(
+                    city_name=data["name"],
+                    country=data["sys"]["country"],
+                    temp=data["main"]["temp"],
+                    feels_like=data["main"]["feels_like"],
+                    temp_unit=TEMP_UNITS.get(unit, "°C"),
+                    description=data["weather"][0]["description"].capitalize(),
+                    humidity=data["main"]["humidity"],
+                    wind_speed=data["wind"]["speed"],
+                    wind_unit=WIND_UNITS.get(unit, "m/s"),
+                )
+                _weather_cache[cache_key] = report
+            return report
+    finally:
+        if not lock.locked():
+            _weather_locks.pop(cache_key, None)
+
+
 @function_tool(
     needs_approval=True
 )
@@ -33,52 +98,14 @@ async def fetch_weather(location: Location) -> str:
     if not city:
         return "Error: No location provided"
 
-    # OpenWeatherMap API endpoint
-    url = "https://api.openweathermap.org/data/2.5/weather"
-
-    params = {"q": city, "appid": OPENWEATHERMAP_API_KEY, "units": unit}
-
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-
-        # Extract weather information
-        temp = data["main"]["temp"]
-        feels_like = data["main"]["feels_like"]
-        humidity = data["main"]["humidity"]
-        description = data["weather"][0]["description"]
-        wind_speed = data["wind"]["speed"]
-        city_name = data["name"]
-        country = data["sys"]["country"]
-
-        # Determine temperature unit symbol
-        temp_unit = {"metric": "°C", "imperial": "°F", "standard": "K"}.get(unit, "°C")
-
-        # Determine wind speed unit
-        wind_unit = (
-            "m/s" if unit == "metric" else "mph" if unit == "imperial" else "m/s"
-        )
-
-        # Format the response
-        weather_info = f"""Weather in {city_name}, {country}:
-🌡️ Temperature: {temp}{temp_unit} (feels like {feels_like}{temp_unit})
-☁️ Conditions: {description.capitalize()}
-💧 Humidity: {humidity}%
-💨 Wind Speed: {wind_speed} {wind_unit}"""
-
-        return weather_info
-
+        return await _get_weather_report(city, unit)
     except httpx.HTTPStatusError as e:
-        if e.response.status_code == 404:
-            return f"Error: City '{city}' not found. Please check the spelling or try a different city."
-        elif e.response.status_code == 401:
-            return "Error: Invalid API key. Please check your OpenWeatherMap API key."
-        else:
-            return (
-                f"Error: Failed to fetch weather data (Status {e.response.status_code})"
-            )
+        status_code = e.response.status_code
+        return HTTP_ERROR_MESSAGES.get(
+            status_code,
+            f"Error: Failed to fetch weather data (Status {status_code})",
+        ).format(city=city)
     except httpx.TimeoutException:
         return "Error: Request timed out. Please try again."
     except httpx.RequestError as e:
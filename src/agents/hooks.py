@@ -1,3 +1,5 @@
+import logging
+
 from agents import (
     Agent,
     AgentHookContext,
@@ -8,6 +10,8 @@ from agents import (
 
 from src.agents.user_context import UserContext
 
+logger = logging.getLogger(__name__)
+
 
 class WeatherAgentHooks(AgentHooks):
     """
@@ -24,7 +28,7 @@ class WeatherAgentHooks(AgentHooks):
             context: The agent hook context
             agent: This agent instance
         """
-        print(f"🚀 Agent '{agent.name}' started")
+        logger.debug("🚀 Agent '%s' started", agent.name)
 
     async def on_end(
         self, context: AgentHookContext[UserContext], agent: Agent, output: str
@@ -37,10 +41,14 @@ class WeatherAgentHooks(AgentHooks):
             agent: This agent instance
             output: The final output produced by the agent
         """
-        print(f"✅ Agent '{agent.name}' completed")
-        print(f"Agent Input tokens: {context.usage.input_tokens}")
-        print(f"Agent Output tokens: {context.usage.output_tokens}")
-        print(f"Agent Total tokens: {context.usage.total_tokens}")
+        usage = context.usage
+        logger.debug(
+            "✅ Agent '%s' completed - tokens in=%d out=%d total=%d",
+            agent.name,
+            usage.input_tokens,
+            usage.output_tokens,
+            usage.total_tokens,
+        )
 
     async def on_tool_start(
         self,
@@ -48,14 +56,17 @@ class WeatherAgentHooks(AgentHooks):
         agent: Agent,
         tool: Tool,
     ) -> None:
-        print(f"🔧 Tool '{tool.name}' started")
-        print(f"Tool arguments: {context.tool_arguments}")
+        logger.debug("🔧 Tool '%s' started - arguments: %s", tool.name, context.tool_arguments)
 
     async def on_tool_end(
         self, context: RunContextWrapper[UserContext], agent: Agent, tool: Tool, result: str
     ) -> None:
-        print(f"✅ Tool '{tool.name}' completed")
-        print(f"Tool Result: {result}")
-        print(f"Tool Input tokens: {context.usage.input_tokens}")
-        print(f"Tool Output tokens: {context.usage.output_tokens}")
-        print(f"Tool Total tokens: {context.usage.total_tokens}")
+        usage = context.usage
+        logger.debug(
+            "✅ Tool '%s' completed - tokens in=%d out=%d total=%d - result: %s",
+            tool.name,
+            usage.input_tokens,
+            usage.output_tokens,
+            usage.total_tokens,
+            result,
+        )
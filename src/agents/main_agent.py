@@ -1,11 +1,14 @@
-from agents import Agent, OpenAIResponsesModel, AsyncOpenAI, RunContextWrapper, WebSearchTool          
+from agents import Agent, OpenAIResponsesModel, RunContextWrapper, WebSearchTool
 
-from src.config import OPENAI_MODEL, OPENAI_API_KEY
-# from src.agents.agent_guardrail import weather_guardrail
+from src.config import GUARDRAIL_ENABLED, OPENAI_MODEL
+from src.openai_client import openai_client
+from src.agents.agent_guardrail import weather_guardrail
 from src.agents.agent_tools import fetch_weather
 from src.agents.hooks import WeatherAgentHooks
 from src.agents.user_context import UserContext
 
+__all__ = ["weather_agent"]
+
 def dynamic_instructions(
     context: RunContextWrapper[UserContext], agent: Agent[UserContext]
 ) -> str:
@@ -14,10 +17,8 @@ def dynamic_instructions(
 weather_agent = Agent[UserContext](
     name="Weather Agent",
     instructions=dynamic_instructions,
-    model=OpenAIResponsesModel(
-        model=OPENAI_MODEL, openai_client=AsyncOpenAI(api_key=OPENAI_API_KEY)
-    ),
-    # input_guardrails=[weather_guardrail],
+    model=OpenAIResponsesModel(model=OPENAI_MODEL, openai_client=openai_client),
+    input_guardrails=[weather_guardrail] if GUARDRAIL_ENABLED else [],
     tools=[fetch_weather, WebSearchTool()],
     hooks=WeatherAgentHooks(),
     tool_use_behavior="run_llm_again"
@@ -1,20 +1,83 @@
 """State manager for handling RunState persistence in Redis for human-in-the-loop approvals."""
 
-import json
+import asyncio
+import threading
 import time
 import logging
 
+import msgpack
+import orjson
+import zstandard as zstd
 from agents import RunState
 
-from src.agents.user_context import UserContext
 from src.utils.redis_client import redis_client
-from src.agents.main_agent import weather_agent
 
 logger = logging.getLogger(__name__)
 
 # TTL for approval state in Redis (1 hour)
 APPROVAL_TTL = 3600
 
+# How long a claim blocks other clicks on the same approval while its run is
+# in progress; comfortably above the worker's task timeout so a crashed run
+# frees the approval again on its own
+APPROVAL_CLAIM_TTL = 120
+
+# Stored payloads are a one-byte format header followed by the msgpack-encoded
+# state, which is zstd-compressed once it's large enough for that to pay off.
+FORMAT_MSGPACK = b"m"
+FORMAT_ZSTD_MSGPACK = b"M"
+COMPRESS_THRESHOLD = 4096
+
+# Approvals saved before this format are a JSON envelope whose "state" field
+# holds RunState.to_string(); still readable so they survive a deploy
+FORMAT_LEGACY_ENVELOPE = b"{"
+
+# Encoding runs in worker threads and zstd contexts aren't thread-safe, so
+# each thread keeps its own.
+_zstd = threading.local()
+
+
+def _get_zstd() -> threading.local:
+    if not hasattr(_zstd, "compressor"):
+        _zstd.compressor = zstd.ZstdCompressor(level=3)
+        _zstd.decompressor = zstd.ZstdDecompressor()
+    return _zstd
+
+
+def _encode_state(state: RunState) -> bytes:
+    """Serialize and compress a RunState into a Redis payload (CPU-bound)."""
+    data = msgpack.packb(state.to_json(), use_bin_type=True)
+    if len(data) > COMPRESS_THRESHOLD:
+        blob = FORMAT_ZSTD_MSGPACK + _get_zstd().compressor.compress(data)
+    else:
+        blob = FORMAT_MSGPACK + data
+    return blob
+
+
+def _decode_state(payload: bytes) -> dict:
+    """Decompress and parse a stored RunState back into its JSON dict (CPU-bound)."""
+    header, data = payload[:1], payload[1:]
+
+    if header == FORMAT_MSGPACK:
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+    if header == FORMAT_ZSTD_MSGPACK:
+        return msgpack.unpackb(
+            _get_zstd().decompressor.decompress(data), raw=False, strict_map_key=False
+        )
+    if header == FORMAT_LEGACY_ENVELOPE:
+        return orjson.loads(orjson.loads(payload)["state"])
+
+    raise ValueError(f"Unknown approval state format: {header!r}")
+
+
+class ApprovalAlreadyHandledError(Exception):
+    """Raised when another click is already handling, or has handled, an approval."""
+
+
+def _approval_claim_key(approval_id: str) -> str:
+    """Key marking an approval as being (or having been) handled."""
+    return f"{approval_id}:claim"
+
 
 async def save_pending_approval(
     chat_id: int,
@@ -34,18 +97,13 @@ async def save_pending_approval(
     timestamp = int(time.time() * 1000)  # milliseconds for uniqueness
     approval_id = f"hitl:{chat_id}:{timestamp}"
 
-    # Serialize state
-    state_data = {
-        "state": state.to_string(),
-        "chat_id": chat_id,
-        "timestamp": timestamp,
-    }
+    # Serialize and compress state off the event loop; chat_id and timestamp
+    # already live in the key
+    payload = await asyncio.to_thread(_encode_state, state)
 
     try:
         # Store in Redis with TTL
-        success = await redis_client.set(
-            key=approval_id, value=json.dumps(state_data), ex=APPROVAL_TTL
-        )
+        success = await redis_client.set(approval_id, payload, ex=APPROVAL_TTL)
 
         if success:
             logger.info(f"✅ Saved approval state: {approval_id}")
@@ -73,26 +131,100 @@ async def get_pending_approval(
     Raises:
         ValueError: If approval not found or expired
     """
+    payload = await redis_client.get(approval_id)
+    return await _restore_state(approval_id, payload)
+
+
+async def claim_pending_approval(
+    approval_id: str,
+) -> RunState:
+    """
+    Claim a pending approval and retrieve its state from Redis.
+
+    The claim (SET NX) and GET run in one MULTI/EXEC round-trip, so a
+    double-clicked button can only resume the agent once. The state itself
+    stays in Redis until complete_pending_approval, so a failed run can be
+    retried after release_pending_approval.
+
+    Args:
+        approval_id: Unique approval ID
+
+    Returns:
+        RunState
+
+    Raises:
+        ApprovalAlreadyHandledError: If another click already claimed it
+        ValueError: If approval not found or expired
+    """
+    claim_key = _approval_claim_key(approval_id)
+
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.set(claim_key, "1", ex=APPROVAL_CLAIM_TTL, nx=True)
+        pipe.get(approval_id)
+        claimed, payload = await pipe.execute()
+
+    if not claimed:
+        raise ApprovalAlreadyHandledError(f"Approval already handled: {approval_id}")
+
+    # Release the claim if the state is missing or can't be restored, so the
+    # caller never holds a claim it doesn't know it took
     try:
-        # Get data from Redis
-        data_str = await redis_client.get(approval_id)
+        return await _restore_state(approval_id, payload)
+    except Exception:
+        await redis_client.delete(claim_key)
+        raise
+
+
+async def complete_pending_approval(approval_id: str) -> None:
+    """
+    Delete a claimed approval's state once its run succeeded.
+
+    The claim is kept for the rest of the approval's lifetime so later clicks
+    on the same button are reported as already handled rather than expired.
+
+    Args:
+        approval_id: Unique approval ID
+    """
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.delete(approval_id)
+        pipe.expire(_approval_claim_key(approval_id), APPROVAL_TTL)
+        await pipe.execute()
+
+    logger.info(f"🗑️  Completed approval: {approval_id}")
+
+
+async def release_pending_approval(approval_id: str) -> None:
+    """
+    Drop the claim on an approval whose run failed so it can be retried.
 
-        if not data_str:
+    Args:
+        approval_id: Unique approval ID
+    """
+    await redis_client.delete(_approval_claim_key(approval_id))
+
+
+async def _restore_state(approval_id: str, payload: bytes | None) -> RunState:
+    """Rebuild a RunState from its stored payload."""
+    try:
+        if not payload:
             raise ValueError(f"Approval state not found or expired: {approval_id}")
 
-        # Parse data
-        data = json.loads(data_str)
+        # Decompress and parse data off the event loop
+        state_json = await asyncio.to_thread(_decode_state, payload)
+
+        # Imported here so saving/deleting approvals doesn't pull in the agent chain
+        from src.agents.main_agent import weather_agent
 
-        state = await RunState.from_string(
+        state = await RunState.from_json(
             initial_agent=weather_agent,
-            state_string=data["state"],
+            state_json=state_json,
         )
 
         logger.info(f"✅ Retrieved approval state: {approval_id}")
         return state
 
-    except json.JSONDecodeError as e:
-        logger.error(f"❌ Error decoding approval state JSON: {e}")
+    except (zstd.ZstdError, orjson.JSONDecodeError, KeyError) as e:
+        logger.error(f"❌ Error decoding approval state: {e}")
         raise ValueError(f"Invalid approval state data: {approval_id}")
     except Exception as e:
         logger.error(f"❌ Error retrieving approval state: {e}")
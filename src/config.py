@@ -1,45 +1,64 @@
-import os
+from functools import lru_cache
+from typing import Annotated
 from urllib.parse import urlparse
 
 from arq.connections import RedisSettings
 from dotenv import load_dotenv
+from pydantic import Field
+from pydantic_settings import BaseSettings
 
+# Still load .env into os.environ: third-party SDKs (e.g. OpenAI tracing) read it directly
 load_dotenv()
 
-TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-TELEGRAM_X_SECRET_KEY = os.getenv("TELEGRAM_X_SECRET_KEY")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENWEATHERMAP_API_KEY = os.getenv("OPENWEATHERMAP_API_KEY")
-DATABASE_URL = os.getenv("DATABASE_URL")
-REDIS_URL = os.getenv("REDIS_URL")
+NonEmptyStr = Annotated[str, Field(min_length=1)]
 
-if not TELEGRAM_BOT_TOKEN:
-    raise ValueError("TELEGRAM_BOT_TOKEN is not set in environment variables")
 
-if not TELEGRAM_X_SECRET_KEY:
-    raise ValueError("TELEGRAM_X_SECRET_KEY is not set in environment variables")
+class Settings(BaseSettings):
+    """Application settings, validated once from environment variables at import."""
 
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY is not set in environment variables")
+    telegram_bot_token: NonEmptyStr
+    telegram_x_secret_key: NonEmptyStr
+    openai_api_key: NonEmptyStr
+    openweathermap_api_key: NonEmptyStr
+    database_url: NonEmptyStr
+    redis_url: NonEmptyStr
+    openai_model: str = "gpt-4.1-mini"
+    log_level: str = "INFO"
+    guardrail_enabled: bool = False
+    guardrail_run_in_parallel: bool = True
+    redis_max_connections: int = Field(default=128, gt=0)
 
-if not OPENWEATHERMAP_API_KEY:
-    raise ValueError("OPENWEATHERMAP_API_KEY is not set in environment variables")
 
-if not DATABASE_URL:
-    raise ValueError("DATABASE_URL is not set in environment variables")
+# Raises a ValidationError listing every missing/empty variable
+settings = Settings()
 
-if not REDIS_URL:
-    raise ValueError("REDIS_URL is not set in environment variables")
+# Module-level aliases kept for existing imports
+TELEGRAM_BOT_TOKEN = settings.telegram_bot_token
+TELEGRAM_X_SECRET_KEY = settings.telegram_x_secret_key
+OPENAI_API_KEY = settings.openai_api_key
+OPENWEATHERMAP_API_KEY = settings.openweathermap_api_key
+DATABASE_URL = settings.database_url
+REDIS_URL = settings.redis_url
+OPENAI_MODEL = settings.openai_model
+LOG_LEVEL = settings.log_level.upper()
+GUARDRAIL_ENABLED = settings.guardrail_enabled
+GUARDRAIL_RUN_IN_PARALLEL = settings.guardrail_run_in_parallel
+REDIS_MAX_CONNECTIONS = settings.redis_max_connections
 
-OPENAI_MODEL = "gpt-4.1-mini"
 
+@lru_cache(maxsize=None)
+def get_arq_redis_settings(max_connections: int | None = None) -> RedisSettings:
+    """
+    Parse REDIS_URL into ARQ RedisSettings (parsed once per pool size, then cached).
 
-def get_arq_redis_settings() -> RedisSettings:
-    """Parse REDIS_URL into ARQ RedisSettings."""
-    parsed = urlparse(REDIS_URL)
+    Args:
+        max_connections: Size limit for ARQ's connection pool (default: unbounded)
+    """
+    parsed = urlparse(settings.redis_url)
     return RedisSettings(
         host=parsed.hostname or "localhost",
         port=parsed.port or 6379,
         database=int(parsed.path.lstrip("/") or 0),
         password=parsed.password,
+        max_connections=max_connections,
     )
@@ -1,5 +1,54 @@
+from agents.extensions.memory import SQLAlchemySession
+from cachetools import LRUCache
+from sqlalchemy import delete, select
 from sqlalchemy.ext.asyncio import create_async_engine
 
 from src.config import DATABASE_URL
 
-engine = create_async_engine(DATABASE_URL)
\ No newline at end of file
+engine = create_async_engine(DATABASE_URL)
+
+
+class ConversationSession(SQLAlchemySession):
+    """SQLAlchemySession that can roll back several items in one round-trip."""
+
+    async def pop_items(self, count: int) -> None:
+        """
+        Remove the count most recent items from the session.
+
+        Args:
+            count: Number of items to remove
+        """
+        await self._ensure_tables()
+        latest_ids = (
+            select(self._messages.c.id)
+            .where(self._messages.c.session_id == self.session_id)
+            .order_by(self._messages.c.created_at.desc(), self._messages.c.id.desc())
+            .limit(count)
+        )
+        async with self._session_factory() as sess:
+            async with sess.begin():
+                await sess.execute(
+                    delete(self._messages).where(self._messages.c.id.in_(latest_ids.scalar_subquery()))
+                )
+
+# Conversation sessions are reused per chat instead of being rebuilt (tables,
+# metadata, lock) for every update
+_sessions: LRUCache[int, ConversationSession] = LRUCache(maxsize=1000)
+
+
+def get_session(chat_id: int) -> ConversationSession:
+    """Return the cached conversation session for a Telegram chat."""
+    session = _sessions.get(chat_id)
+    if session is None:
+        session = _sessions[chat_id] = ConversationSession(
+            session_id=f"conv_telegram_{chat_id}",
+            engine=engine,
+        )
+    return session
+
+
+async def create_tables() -> None:
+    """Create the session tables once at startup instead of probing on every request."""
+    bootstrap = SQLAlchemySession(session_id="_bootstrap", engine=engine, create_tables=True)
+    # Any session call runs the pending CREATE TABLE IF NOT EXISTS first
+    await bootstrap.get_items(limit=1)
@@ -1,11 +1,18 @@
+import logging
+
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from contextlib import asynccontextmanager
 
 from arq import create_pool
 
 from src.routes import health, telegram
+from src.utils.http_clients import close_http_clients, telegram_client, warm_http_clients
+from src.utils.logging_config import setup_logging
 from src.utils.redis_client import redis_client
-from src.config import REDIS_URL, get_arq_redis_settings
+from src.config import LOG_LEVEL, REDIS_URL, get_arq_redis_settings
+
+logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
@@ -13,34 +20,46 @@ async def lifespan(app: FastAPI):
     """
     Lifespan event handler for application startup and shutdown.
     """
+    log_listener = setup_logging(LOG_LEVEL)
+
     # Startup: Connect to Redis
-    print(f"🚀 Starting up - connecting to Redis at {REDIS_URL}")
+    logger.info("🚀 Starting up - connecting to Redis at %s", REDIS_URL)
     try:
         await redis_client.connect(REDIS_URL)
     except Exception as e:
-        print(f"⚠️  Warning: Failed to connect to Redis: {e}")
-        print("⚠️  Human-in-the-loop approvals will not work without Redis")
+        logger.warning("⚠️  Failed to connect to Redis: %s", e)
+        logger.warning("⚠️  Human-in-the-loop approvals will not work without Redis")
 
     # Startup: Create ARQ connection pool for enqueuing jobs
-    print("🚀 Starting up - creating ARQ connection pool")
+    logger.info("🚀 Starting up - creating ARQ connection pool")
     app.state.arq_pool = await create_pool(get_arq_redis_settings())
 
+    # Startup: Open pooled HTTP connections ahead of first use
+    # The API only talks to Telegram (setWebhook); weather calls run in the worker
+    await warm_http_clients(telegram_client)
+
     yield
 
     # Shutdown: Close ARQ pool
-    print("🛑 Shutting down - closing ARQ connection pool")
+    logger.info("🛑 Shutting down - closing ARQ connection pool")
     await app.state.arq_pool.aclose()
 
     # Shutdown: Disconnect from Redis
-    print("🛑 Shutting down - disconnecting from Redis")
+    logger.info("🛑 Shutting down - disconnecting from Redis")
     await redis_client.disconnect()
 
+    # Shutdown: Close shared HTTP clients
+    await close_http_clients()
+
+    log_listener.stop()
+
 
 app = FastAPI(
     title="AI Agents API",
     description="API for AI agents beyond Jupyter notebook",
     version="0.1.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # Include routers
@@ -0,0 +1,13 @@
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from src.config import OPENAI_API_KEY
+
+# Shared by every agent so they all reuse one HTTP/2 connection pool to OpenAI
+openai_client = AsyncOpenAI(
+    api_key=OPENAI_API_KEY,
+    http_client=DefaultAsyncHttpxClient(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=50),
+    ),
+)
@@ -1,123 +1,219 @@
 """ARQ task functions for processing Telegram updates in the background."""
 
+import asyncio
+import logging
+import time
+import uuid
+from typing import Awaitable, Optional
+
+import orjson
 from agents import InputGuardrailTripwireTriggered, Runner
-from agents.extensions.memory import SQLAlchemySession
 
 from src.agents.main_agent import weather_agent
 from src.agents.state_manager import (
+    ApprovalAlreadyHandledError,
+    claim_pending_approval,
+    complete_pending_approval,
+    release_pending_approval,
     save_pending_approval,
-    get_pending_approval,
-    delete_pending_approval,
 )
 from src.agents.user_context import UserContext
-from src.database import engine
+from src.database import get_session
+from src.utils.redis_client import redis_client
 from src.utils.telegram import (
-    SendMessageRequest,
-    send_message,
-    extract_chat_id_from_update,
-    extract_message_text_from_update,
-    extract_user_info_from_update,
-    extract_photo_from_update,
-    extract_document_from_update,
-    get_telegram_file_url,
+    UpdateView,
+    parse_update,
+    send_message_simple,
+    get_telegram_file_url_cached,
     build_multimodal_input,
     send_approval_request,
     answer_callback_query,
 )
 
+logger = logging.getLogger(__name__)
+
+# Telegram redelivers updates it didn't get a quick ACK for; remember seen
+# update_ids long enough to drop those retries
+UPDATE_DEDUPE_TTL = 600
+
+# At most CHAT_CONCURRENCY_LIMIT messages from one chat run at once so a noisy
+# chat can't take over the worker's job slots; extra messages are re-queued
+# after CHAT_DEFER_SECONDS. Slots of jobs that died without releasing them
+# expire after CHAT_SLOT_TTL (the worker's task timeout).
+CHAT_CONCURRENCY_LIMIT = 5
+CHAT_DEFER_SECONDS = 1
+CHAT_SLOT_TTL = 60
+
+# KEYS[1]: the chat's slot set; ARGV: now, slot TTL, limit, slot member
+_ACQUIRE_CHAT_SLOT_SCRIPT = """
+local now = tonumber(ARGV[1])
+local ttl = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - ttl)
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[3]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], now, ARGV[4])
+redis.call('EXPIRE', KEYS[1], ttl)
+return 1
+"""
+
+
+def _chat_slots_key(chat_id: int) -> str:
+    return f"concurrent:{chat_id}"
+
+
+async def _acquire_chat_slot(chat_id: int, member: str) -> bool:
+    """Claim one of the chat's concurrency slots; fails open if Redis errors."""
+    acquired = await redis_client.run_script(
+        _ACQUIRE_CHAT_SLOT_SCRIPT,
+        keys=[_chat_slots_key(chat_id)],
+        args=[time.time(), CHAT_SLOT_TTL, CHAT_CONCURRENCY_LIMIT, member],
+    )
+    return acquired != 0
+
+
+async def _gather_cleanup(*aws: Awaitable) -> None:
+    """Run independent error-path steps (replies, history cleanup) concurrently."""
+    for result in await asyncio.gather(*aws, return_exceptions=True):
+        if isinstance(result, Exception):
+            logger.warning("⚠️  Error-path step failed: %s", result)
+
+
+# Static replies, built once instead of on every update
+BOT_REJECT_TEXT = "🤖 I don't respond to other bots. If you're a human, please use a regular account!"
+IMAGE_ERROR_TEXT = "Sorry, I couldn't process that image. Please try again or send a different image."
+DOCUMENT_ERROR_TEXT = "Sorry, I couldn't process that document. Please try again or send a different file."
+GUARDRAIL_REJECT_TEXT = "I'm sorry {first_name}, I can't help with that. Please ask me about something else."
+GENERIC_ERROR_TEXT = "Sorry, something went wrong. Please try again later."
+MEDIA_ERROR_TEXTS = {"image": IMAGE_ERROR_TEXT, "file": DOCUMENT_ERROR_TEXT}
+PROCESSING_TEXT = "⏳ Processing…"
+APPROVAL_EXPIRED_ALERT = "⚠️ This approval has expired"
+APPROVAL_EXPIRED_TEXT = "⚠️ This approval request has expired. Please try your request again."
+APPROVAL_ERROR_ALERT = "❌ Error processing approval"
+APPROVAL_HANDLED_ALERT = "ℹ️ This approval has already been handled"
+
 
-async def process_message_task(ctx: dict, update: dict) -> None:
+async def ingest_update_task(ctx: dict, body: bytes) -> None:
+    """
+    Parse a raw Telegram webhook body and dispatch it to the matching handler.
+
+    The webhook only verifies the secret token and enqueues the body, so
+    duplicate delivery checks, bot filtering and routing between messages and
+    callback queries happen here.
+    """
+    update = orjson.loads(body)
+
+    update_id = update.get("update_id")
+    if update_id is not None:
+        # None means Redis failed; process the update rather than drop it
+        first_seen = await redis_client.set(
+            f"tg:upd:{update_id}", "1", ex=UPDATE_DEDUPE_TTL, nx=True
+        )
+        if first_seen is False:
+            logger.info("Skipping duplicate update %s", update_id)
+            return
+
+    view = parse_update(update)
+
+    # Handle callback queries (button clicks) for human-in-the-loop approvals
+    if "callback_query" in update:
+        await process_callback_query_task(ctx, update, view)
+        return
+
+    user_info = view.user_info
+    if user_info and user_info.is_bot:
+        if view.chat_id:
+            logger.info("⚠️  Ignoring message from bot: %s", user_info.first_name)
+            await send_message_simple(view.chat_id, BOT_REJECT_TEXT)
+        return
+
+    await process_message_task(ctx, update, view)
+
+
+async def process_message_task(
+    ctx: dict, update: dict, view: Optional[UpdateView] = None
+) -> None:
     """
     Process an incoming Telegram message via the AI agent.
 
     Extracted from the webhook handler so it runs in an ARQ background worker
-    instead of blocking the HTTP response.
+    instead of blocking the HTTP response. view is the already-parsed update
+    when called from ingest_update_task.
     """
-    chat_id = extract_chat_id_from_update(update)
-    user_info = extract_user_info_from_update(update)
+    view = view or parse_update(update)
+    chat_id = view.chat_id
 
     if not chat_id:
-        print("No chat_id found in update")
+        logger.warning("No chat_id found in update")
         return
 
+    member = ctx.get("job_id") or uuid.uuid4().hex
+    if not await _acquire_chat_slot(chat_id, member):
+        logger.info("⏳ Chat %s is at its concurrency limit, deferring message", chat_id)
+        await ctx["redis"].enqueue_job(
+            "process_message_task", update, _defer_by=CHAT_DEFER_SECONDS
+        )
+        return
+
+    try:
+        await _handle_message(view, chat_id)
+    finally:
+        await redis_client.zrem(_chat_slots_key(chat_id), member)
+
+
+async def _handle_message(view: UpdateView, chat_id: int) -> None:
+    """Run the agent on a message and send its reply or approval request."""
+    user_info = view.user_info
     first_name = user_info.first_name if user_info else "User"
     user_id = user_info.user_id if user_info else "Unknown"
     is_bot = user_info.is_bot if user_info else False
 
-    print(f"👤 Message from: {first_name} (ID: {user_id})")
+    logger.info("👤 Message from: %s (ID: %s)", first_name, user_id)
 
     user_context = UserContext(chat_id=chat_id, first_name=first_name, is_bot=is_bot)
 
-    session = SQLAlchemySession(
-        session_id=f"conv_telegram_{chat_id}",
-        engine=engine,
-        create_tables=True,
-    )
+    session = get_session(chat_id)
 
     try:
         # Determine input type and build appropriate agent input
         agent_input = None
         input_type = "text"
 
-        # Check for photos first
-        photo_data = extract_photo_from_update(update)
-        if photo_data:
-            try:
-                print(f"📷 Processing photo with caption: {photo_data.get('caption')}")
-                file_url = await get_telegram_file_url(photo_data["file_id"])
-                agent_input = build_multimodal_input(
-                    text=photo_data.get("caption"),
-                    file_url=file_url,
-                    file_type="image",
-                )
-                input_type = "image"
-            except Exception as e:
-                print(f"❌ Error processing photo: {e}")
-                await send_message(
-                    SendMessageRequest(
-                        chat_id=chat_id,
-                        text="Sorry, I couldn't process that image. Please try again or send a different image.",
-                    ),
-                )
-                return
+        # Check for photos first, then documents
+        if view.photo:
+            media_data, file_type, input_type = view.photo, "image", "image"
+        elif view.document:
+            media_data, file_type, input_type = view.document, "file", "document"
+        else:
+            media_data = None
 
-        # Check for documents
-        elif document_data := extract_document_from_update(update):
+        if media_data:
             try:
-                print(
-                    f"📄 Processing document: {document_data.get('file_name')} ({document_data.get('mime_type')})"
-                )
-                print(f"   Caption: {document_data.get('caption')}")
-                file_url = await get_telegram_file_url(document_data["file_id"])
+                logger.debug("📎 Processing %s: %s", input_type, media_data)
+                file_url = await get_telegram_file_url_cached(media_data["file_id"])
                 agent_input = build_multimodal_input(
-                    text=document_data.get("caption"),
+                    text=media_data.get("caption"),
                     file_url=file_url,
-                    file_type="file",
+                    file_type=file_type,
                 )
-                input_type = "document"
             except Exception as e:
-                print(f"❌ Error processing document: {e}")
-                await send_message(
-                    SendMessageRequest(
-                        chat_id=chat_id,
-                        text="Sorry, I couldn't process that document. Please try again or send a different file.",
-                    ),
-                )
+                logger.warning("❌ Error processing %s: %s", input_type, e)
+                await send_message_simple(chat_id, MEDIA_ERROR_TEXTS[file_type])
                 return
 
         # Fallback to text
         else:
-            agent_input = extract_message_text_from_update(update)
-            print(f"💬 Message: {agent_input}")
+            agent_input = view.text
+            logger.debug("💬 Message: %s", agent_input)
             input_type = "text"
 
         # Check if we have valid input
         if not agent_input:
-            print("⚠️  No valid input found in update")
+            logger.info("⚠️  No valid input found in update")
             return
 
         # Process the message with the agent
-        print(f"🤖 Sending {input_type} input to agent...")
+        logger.info("🤖 Sending %s input to agent...", input_type)
         result = await Runner.run(
             starting_agent=weather_agent,
             input=agent_input,
@@ -127,8 +223,8 @@ async def process_message_task(ctx: dict, update: dict) -> None:
 
         # Check for interruptions (human-in-the-loop approvals)
         if result.interruptions:
-            print(
-                f"⏸️  Agent paused - approval required for {len(result.interruptions)} tool(s)"
+            logger.info(
+                "⏸️  Agent paused - approval required for %d tool(s)", len(result.interruptions)
             )
 
             interruption = result.interruptions[0]
@@ -147,95 +243,92 @@ async def process_message_task(ctx: dict, update: dict) -> None:
                 approval_id=approval_id,
             )
 
-            print(f"✅ Sent approval request with ID: {approval_id}")
+            logger.info("✅ Sent approval request with ID: %s", approval_id)
             return
 
         # Normal flow if no interruptions
         response_text = result.final_output
-        await send_message(
-            SendMessageRequest(chat_id=chat_id, text=response_text),
-        )
-        print("✅ Sent final response to user")
+        await send_message_simple(chat_id, response_text)
+        logger.info("✅ Sent final response to user")
 
     except InputGuardrailTripwireTriggered:
-        await send_message(
-            SendMessageRequest(
-                chat_id=chat_id,
-                text=f"I'm sorry {first_name}, I can't help with that. Please ask me about something else.",
-            ),
+        await _gather_cleanup(
+            send_message_simple(chat_id, GUARDRAIL_REJECT_TEXT.format(first_name=first_name)),
+            session.pop_item(),
         )
-        await session.pop_item()
 
     except Exception as e:
-        print(f"❌ Error processing message: {e}")
-        if chat_id:
-            await send_message(
-                SendMessageRequest(
-                    chat_id=chat_id,
-                    text="Sorry, something went wrong. Please try again later.",
-                ),
-            )
-        await session.pop_item()
+        logger.exception("❌ Error processing message: %s", e)
+        await _gather_cleanup(
+            send_message_simple(chat_id, GENERIC_ERROR_TEXT),
+            session.pop_item(),
+        )
 
 
-async def process_callback_query_task(ctx: dict, update: dict) -> None:
+async def process_callback_query_task(
+    ctx: dict, update: dict, view: Optional[UpdateView] = None
+) -> None:
     """
     Handle callback query from inline keyboard buttons (approve/reject).
 
     Extracted from the webhook handler so it runs in an ARQ background worker
-    instead of blocking the HTTP response.
+    instead of blocking the HTTP response. view is the already-parsed update
+    when called from ingest_update_task.
     """
+    view = view or parse_update(update)
     callback_query = update["callback_query"]
     callback_id = callback_query["id"]
     callback_data = callback_query["data"]
-    chat_id = callback_query["message"]["chat"]["id"]
+    chat_id = view.chat_id
 
     # Extract user info
-    user_info = extract_user_info_from_update(update)
+    user_info = view.user_info
     first_name = user_info.first_name if user_info else "User"
     is_bot = user_info.is_bot if user_info else False
 
     user_context = UserContext(chat_id=chat_id, first_name=first_name, is_bot=is_bot)
 
-    session = SQLAlchemySession(
-        session_id=f"conv_telegram_{chat_id}",
-        engine=engine,
-        create_tables=True,
-    )
+    session = get_session(chat_id)
+    answered = False
+    claimed = False
 
     try:
         # Parse callback data: "approve:{approval_id}" or "reject:{approval_id}"
         action, approval_id = callback_data.split(":", 1)
 
-        print(f"🔘 Callback: {action} for approval {approval_id}")
+        logger.info("🔘 Callback: %s for approval %s", action, approval_id)
 
-        # Retrieve state from Redis with proper context restoration
-        state = await get_pending_approval(
-            approval_id=approval_id,
+        # Stop the button's spinner while the state is fetched, rather than
+        # after it's been restored; the toast stays neutral since the approval
+        # may turn out to be expired or already handled. claim_pending_approval
+        # claims the approval and retrieves its state with context restoration
+        answer, state = await asyncio.gather(
+            answer_callback_query(callback_query_id=callback_id, text=PROCESSING_TEXT),
+            claim_pending_approval(approval_id=approval_id),
+            return_exceptions=True,
         )
+        answered = True
+        if isinstance(answer, Exception):
+            logger.warning("⚠️  Failed to answer callback query: %s", answer)
+        if isinstance(state, Exception):
+            raise state
+        claimed = True
 
         # Apply decision
         interruptions = state.get_interruptions()
 
-        print("Interruption: ", interruptions[0])
+        logger.debug("Interruptions: %s", interruptions)
 
-        if action == "approve":
-            if interruptions:
+        if interruptions:
+            if action == "approve":
                 state.approve(interruptions[0])
-                await answer_callback_query(
-                    callback_query_id=callback_id, text="✅ Approved"
-                )
-        else:  # reject
-            if interruptions:
+            else:  # reject
                 state.reject(interruptions[0])
-                await answer_callback_query(
-                    callback_query_id=callback_id, text="❌ Rejected"
-                )
 
-        print("Interruption: ", interruptions[0])
+        logger.debug("Interruptions: %s", interruptions)
 
         # Resume agent execution
-        print("▶️  Resuming agent execution...")
+        logger.info("▶️  Resuming agent execution...")
         result = await Runner.run(
             starting_agent=weather_agent,
             input=state,
@@ -245,7 +338,7 @@ async def process_callback_query_task(ctx: dict, update: dict) -> None:
 
         # Check if there are more interruptions (nested approvals)
         if result.interruptions:
-            print("⏸️  Agent paused again - another approval required")
+            logger.info("⏸️  Agent paused again - another approval required")
 
             new_interruption = result.interruptions[0]
             new_approval_id = await save_pending_approval(
@@ -261,37 +354,41 @@ async def process_callback_query_task(ctx: dict, update: dict) -> None:
             )
         else:
             response_text = result.final_output
-            await send_message(
-                SendMessageRequest(chat_id=chat_id, text=response_text)
-            )
-            print("✅ Sent final response to user")
+            await send_message_simple(chat_id, response_text)
+            logger.info("✅ Sent final response to user")
 
-        # Cleanup Redis
-        await delete_pending_approval(approval_id)
+        await complete_pending_approval(approval_id)
+
+    except ApprovalAlreadyHandledError as e:
+        # A repeated click; the first one owns the run and the history
+        logger.info("🔁 %s", e)
+        if not answered:
+            await answer_callback_query(
+                callback_query_id=callback_id, text=APPROVAL_HANDLED_ALERT
+            )
 
     except ValueError as e:
-        print(f"⚠️  Approval error: {e}")
-        await answer_callback_query(
-            callback_query_id=callback_id, text="⚠️ This approval has expired"
-        )
-        await send_message(
-            SendMessageRequest(
-                chat_id=chat_id,
-                text="⚠️ This approval request has expired. Please try your request again.",
+        logger.warning("⚠️  Approval error: %s", e)
+        steps = [send_message_simple(chat_id, APPROVAL_EXPIRED_TEXT), session.pop_items(2)]
+        if claimed:
+            steps.append(release_pending_approval(approval_id))
+        if not answered:
+            steps.append(
+                answer_callback_query(callback_query_id=callback_id, text=APPROVAL_EXPIRED_ALERT)
             )
-        )
-        await session.pop_item()
-        await session.pop_item()
+        await _gather_cleanup(*steps)
 
     except Exception as e:
-        print(f"❌ Error processing callback: {e}")
-        await answer_callback_query(
-            callback_query_id=callback_id, text="❌ Error processing approval"
-        )
-        await send_message(
-            SendMessageRequest(
-                chat_id=chat_id, text=f"❌ Error processing approval: {str(e)}"
+        logger.exception("❌ Error processing callback: %s", e)
+        steps = [
+            send_message_simple(chat_id, f"{APPROVAL_ERROR_ALERT}: {str(e)}"),
+            session.pop_items(2),
+        ]
+        if claimed:
+            # Keep the state and let the user press the button again
+            steps.append(release_pending_approval(approval_id))
+        if not answered:
+            steps.append(
+                answer_callback_query(callback_query_id=callback_id, text=APPROVAL_ERROR_ALERT)
             )
-        )
-        await session.pop_item()
-        await session.pop_item()
+        await _gather_cleanup(*steps)
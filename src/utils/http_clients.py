@@ -0,0 +1,57 @@
+"""Shared httpx clients so outbound calls reuse pooled keep-alive connections.
+
+Clients speak HTTP/2 so concurrent requests to the same host are multiplexed
+over one connection instead of each opening its own.
+"""
+
+import asyncio
+import logging
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# OpenWeatherMap, used by the fetch_weather tool
+weather_client = httpx.AsyncClient(
+    http2=True,
+    base_url="https://api.openweathermap.org",
+    timeout=httpx.Timeout(10.0),
+    limits=httpx.Limits(
+        max_keepalive_connections=20, max_connections=100, keepalive_expiry=30
+    ),
+)
+
+# Telegram Bot API, used by the webhook route and the telegram utils
+telegram_client = httpx.AsyncClient(
+    http2=True,
+    base_url="https://api.telegram.org",
+    # Bot API calls post pre-serialized JSON bodies as raw content
+    headers={"Content-Type": "application/json"},
+    # Fail fast when Telegram can't be reached instead of holding a job for 10s
+    timeout=httpx.Timeout(10.0, connect=5.0),
+    limits=httpx.Limits(
+        max_keepalive_connections=100, max_connections=200, keepalive_expiry=75
+    ),
+)
+
+
+async def warm_http_clients(*clients: httpx.AsyncClient) -> None:
+    """
+    Open a pooled connection to each client's host at startup so the first
+    real call doesn't pay for DNS, TCP and TLS setup. Failures are only logged.
+
+    Args:
+        clients: The clients this process actually uses
+    """
+    results = await asyncio.gather(
+        *(client.head("/") for client in clients), return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            logger.warning("⚠️  Failed to warm HTTP client: %s", result)
+
+
+async def close_http_clients() -> None:
+    """Close every shared client and its connection pool."""
+    await weather_client.aclose()
+    await telegram_client.aclose()
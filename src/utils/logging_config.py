@@ -0,0 +1,35 @@
+"""Logging setup that keeps log I/O off the event loop."""
+
+import logging
+import logging.handlers
+import queue
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+def setup_logging(level: str) -> logging.handlers.QueueListener:
+    """
+    Route all log records through a QueueHandler.
+
+    Records are only put on an in-memory queue by the calling coroutine; a
+    QueueListener thread does the actual formatting and stream writes, so
+    concurrent tasks never block on stdout.
+
+    Args:
+        level: Root log level name (e.g. "INFO", "DEBUG")
+
+    Returns:
+        The started QueueListener. Call stop() on shutdown to flush pending records.
+    """
+    log_queue: queue.Queue = queue.Queue(-1)
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    listener.start()
+    return listener
@@ -1,16 +1,38 @@
 """Redis client module for managing async Redis connections."""
+import asyncio
+import socket
 import redis.asyncio as redis
-from typing import Optional
+from redis.asyncio.client import Pipeline
+from redis.commands.core import AsyncScript
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff
+from redis.exceptions import ConnectionError as RedisConnectionError
+from typing import Any, Dict, List, Optional, Union
 import logging
 
+from src.config import REDIS_MAX_CONNECTIONS
+
 logger = logging.getLogger(__name__)
 
+# Connections opened up front on connect so the first burst of concurrent
+# operations doesn't pay for TCP handshakes
+REDIS_PREWARM_CONNECTIONS = 10
+
+# Probe idle connections so dead ones are noticed before a burst reuses them
+# (the TCP_KEEP* options are Linux-specific, so only pass the ones available)
+SOCKET_KEEPALIVE_OPTIONS = {
+    getattr(socket, name): value
+    for name, value in (("TCP_KEEPIDLE", 30), ("TCP_KEEPINTVL", 10), ("TCP_KEEPCNT", 3))
+    if hasattr(socket, name)
+}
+
 
 class RedisClient:
     """Singleton Redis client with connection pooling."""
     
     _instance: Optional["RedisClient"] = None
     _client: Optional[redis.Redis] = None
+    _scripts: Dict[str, AsyncScript] = {}
     
     def __new__(cls):
         if cls._instance is None:
@@ -23,22 +45,44 @@ class RedisClient:
             # Will be initialized on first connect
             pass
     
-    async def connect(self, redis_url: str = "redis://localhost:6379") -> None:
+    async def connect(
+        self, redis_url: str = "redis://localhost:6379", max_connections: Optional[int] = None
+    ) -> None:
         """
         Connect to Redis server.
         
         Args:
             redis_url: Redis connection URL (default: redis://localhost:6379)
+            max_connections: Connection pool size (default: REDIS_MAX_CONNECTIONS)
         """
+        max_connections = max_connections or REDIS_MAX_CONNECTIONS
         try:
+            # Responses are returned as raw bytes; callers decode text values
+            # themselves so binary payloads skip a UTF-8 round-trip
+            self._scripts = {}
             self._client = await redis.from_url(
                 redis_url,
-                encoding="utf-8",
-                decode_responses=True,
-                max_connections=10,
+                max_connections=max_connections,
+                single_connection_client=False,
+                socket_keepalive=True,
+                socket_keepalive_options=SOCKET_KEEPALIVE_OPTIONS,
+                health_check_interval=30,
+                # Only retry connection errors: a timed-out SET NX, claim
+                # pipeline or Lua script may already have been applied, and
+                # none of them are safe to replay
+                retry=Retry(
+                    ExponentialBackoff(), 3, supported_errors=(RedisConnectionError,)
+                ),
             )
             # Test connection
             await self._client.ping()
+            # Concurrent pings each check out their own pooled connection
+            await asyncio.gather(
+                *(
+                    self._client.ping()
+                    for _ in range(min(REDIS_PREWARM_CONNECTIONS, max_connections))
+                )
+            )
             logger.info(f"✅ Connected to Redis at {redis_url}")
         except Exception as e:
             logger.error(f"❌ Failed to connect to Redis: {e}")
@@ -51,7 +95,7 @@ class RedisClient:
             self._client = None
             logger.info("🔌 Disconnected from Redis")
     
-    async def get(self, key: str) -> Optional[str]:
+    async def get(self, key: str) -> Optional[bytes]:
         """
         Get value from Redis.
         
@@ -59,7 +103,7 @@ class RedisClient:
             key: Redis key
             
         Returns:
-            Value as string or None if not found
+            Value as bytes or None if not found
         """
         if not self._client:
             raise RuntimeError("Redis client not connected. Call connect() first.")
@@ -73,29 +117,31 @@ class RedisClient:
     async def set(
         self, 
         key: str, 
-        value: str, 
-        ex: Optional[int] = None
-    ) -> bool:
+        value: Union[bytes, str], 
+        ex: Optional[int] = None,
+        nx: bool = False
+    ) -> Optional[bool]:
         """
         Set value in Redis with optional expiration.
         
         Args:
             key: Redis key
-            value: Value to store
+            value: Value to store (str values are stored UTF-8 encoded)
             ex: Expiration time in seconds (optional)
+            nx: Only set the key if it doesn't exist yet (default: False)
             
         Returns:
-            True if successful, False otherwise
+            True if the key was set, False if nx is set and the key already
+            exists, None if the command failed
         """
         if not self._client:
             raise RuntimeError("Redis client not connected. Call connect() first.")
         
         try:
-            await self._client.set(key, value, ex=ex)
-            return True
+            return bool(await self._client.set(key, value, ex=ex, nx=nx))
         except Exception as e:
             logger.error(f"Error setting key {key}: {e}")
-            return False
+            return None
     
     async def delete(self, key: str) -> bool:
         """
@@ -117,6 +163,50 @@ class RedisClient:
             logger.error(f"Error deleting key {key}: {e}")
             return False
     
+    async def zrem(self, key: str, member: str) -> bool:
+        """
+        Remove a member from a Redis sorted set.
+        
+        Args:
+            key: Redis key
+            member: Member to remove
+            
+        Returns:
+            True if the member was removed, False otherwise
+        """
+        if not self._client:
+            raise RuntimeError("Redis client not connected. Call connect() first.")
+        
+        try:
+            return await self._client.zrem(key, member) > 0
+        except Exception as e:
+            logger.error(f"Error removing {member} from {key}: {e}")
+            return False
+    
+    async def run_script(self, script: str, keys: List[str], args: List[Any]) -> Any:
+        """
+        Run a Lua script atomically, loading it once and then calling it by SHA.
+        
+        Args:
+            script: Lua source
+            keys: Keys the script touches (KEYS)
+            args: Script arguments (ARGV)
+            
+        Returns:
+            The script's return value, or None if it failed
+        """
+        if not self._client:
+            raise RuntimeError("Redis client not connected. Call connect() first.")
+        
+        try:
+            registered = self._scripts.get(script)
+            if registered is None:
+                registered = self._scripts[script] = self._client.register_script(script)
+            return await registered(keys=keys, args=args)
+        except Exception as e:
+            logger.error(f"Error running script on keys {keys}: {e}")
+            return None
+    
     async def exists(self, key: str) -> bool:
         """
         Check if key exists in Redis.
@@ -137,6 +227,21 @@ class RedisClient:
             logger.error(f"Error checking key {key}: {e}")
             return False
     
+    def pipeline(self, transaction: bool = True) -> Pipeline:
+        """
+        Create a pipeline to send several commands in a single round-trip.
+        
+        Args:
+            transaction: Wrap the commands in MULTI/EXEC (default: True)
+            
+        Returns:
+            Redis pipeline, to be used as an async context manager
+        """
+        if not self._client:
+            raise RuntimeError("Redis client not connected. Call connect() first.")
+        
+        return self._client.pipeline(transaction=transaction)
+    
     @property
     def is_connected(self) -> bool:
         """Check if Redis client is connected."""
@@ -1,40 +1,196 @@
+import asyncio
+import hmac
+import logging
+import time
+from dataclasses import dataclass
 from typing import Optional, Literal
 
-import httpx
-from pydantic import BaseModel
+import orjson
+from cachetools import TTLCache
+
+from src.config import TELEGRAM_BOT_TOKEN, TELEGRAM_X_SECRET_KEY
+from src.utils.http_clients import telegram_client
+from src.utils.redis_client import redis_client
+
+__all__ = [
+    "AsyncTokenBucket",
+    "UpdateView",
+    "UserInfo",
+    "answer_callback_query",
+    "build_approval_keyboard",
+    "build_multimodal_input",
+    "extract_chat_id_from_update",
+    "extract_document_from_update",
+    "extract_message_text_from_update",
+    "extract_photo_from_update",
+    "extract_user_info_from_update",
+    "get_telegram_file_url_cached",
+    "parse_update",
+    "send_approval_request",
+    "send_message_simple",
+    "verify_secret_token",
+]
+
+logger = logging.getLogger(__name__)
+
+# Bot API paths (relative to telegram_client's base_url) and the file download
+# prefix, built once since they embed the bot token
+_METHOD_PATHS = {
+    method: f"/bot{TELEGRAM_BOT_TOKEN}/{method}"
+    for method in ("sendMessage", "answerCallbackQuery", "getFile")
+}
+_FILE_DOWNLOAD_PREFIX = f"https://api.telegram.org/file/bot{TELEGRAM_BOT_TOKEN}/"
+
+# Webhook secret as bytes, encoded once for verify_secret_token
+_SECRET_TOKEN_BYTES = TELEGRAM_X_SECRET_KEY.encode()
+
+# Update types the extractors understand, in the order they're looked up
+_UPDATE_KEYS = ("message", "callback_query", "edited_message")
+
+# Responses API content part type and URL key for each file type
+_FILE_PARTS = {"image": ("input_image", "image_url"), "file": ("input_file", "file_url")}
+
+# Pre-serialized approval keyboard; approval IDs (hitl:{chat_id}:{ts}) never
+# need JSON escaping
+_APPROVAL_KEYBOARD_TEMPLATE = (
+    '{{"inline_keyboard":[['
+    '{{"text":"✅ Approve","callback_data":"approve:{approval_id}"}},'
+    '{{"text":"❌ Reject","callback_data":"reject:{approval_id}"}}'
+    ']]}}'
+)
+
+# Telegram allows ~30 messages/s per bot and ~1 message/s per chat; stay a
+# little under the global limit. Limits are enforced per process.
+GLOBAL_SEND_RATE = 25
+CHAT_SEND_RATE = 1
+CHAT_SEND_BURST = 3
+
+# Identical messages to the same chat within this window (seconds) are sent
+# once, e.g. the same error reply produced by a burst of failing updates
+DUPLICATE_SEND_WINDOW = 0.2
+
+# Telegram keeps a file_id's download path valid for at least an hour
+FILE_PATH_TTL = 3000
+
+
+class AsyncTokenBucket:
+    """Token bucket that makes callers wait until a token is available."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Take one token, sleeping until the bucket has refilled enough."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+_global_bucket = AsyncTokenBucket(rate=GLOBAL_SEND_RATE, capacity=GLOBAL_SEND_RATE)
+# Idle chats' buckets expire instead of accumulating forever; _throttle
+# re-inserts on every send so an active chat's bucket is never reset
+_chat_buckets: TTLCache[int, AsyncTokenBucket] = TTLCache(maxsize=10_000, ttl=60)
+
+
+_recent_sends: TTLCache[tuple[int, str], bool] = TTLCache(maxsize=10_000, ttl=DUPLICATE_SEND_WINDOW)
+
+
+async def _throttle(chat_id: int) -> None:
+    """Wait for both the global and the per-chat send budget."""
+    bucket = _chat_buckets.get(chat_id)
+    if bucket is None:
+        bucket = AsyncTokenBucket(rate=CHAT_SEND_RATE, capacity=CHAT_SEND_BURST)
+    # TTLCache expires by insertion time, so refresh it on each use
+    _chat_buckets[chat_id] = bucket
+    await _global_bucket.acquire()
+    await bucket.acquire()
+
+
+async def _post(method: str, payload: dict, chat_id: Optional[int] = None) -> None:
+    """
+    POST a Bot API method, throttled per chat and retried once on HTTP 429.
 
-from src.config import TELEGRAM_BOT_TOKEN
+    Args:
+        method: Bot API method name (e.g., "sendMessage")
+        payload: JSON payload for the method
+        chat_id: Chat the call sends to; None skips the send-rate throttling
 
+    Raises:
+        httpx.HTTPError: If the request fails (including a second 429)
+    """
+    # Serialized with orjson rather than httpx's stdlib json encoder; the
+    # client already sends Content-Type: application/json
+    content = orjson.dumps(payload)
 
-class SendMessageRequest(BaseModel):
-    chat_id: int
-    text: str
+    for attempt in range(2):
+        if chat_id is not None:
+            await _throttle(chat_id)
 
+        response = await telegram_client.post(_METHOD_PATHS[method], content=content)
+        if response.status_code != 429 or attempt:
+            break
 
-async def send_message(request: SendMessageRequest) -> dict:
+        retry_after = orjson.loads(response.content).get("parameters", {}).get("retry_after", 1)
+        logger.warning("Telegram rate limit hit on %s, retrying in %ss", method, retry_after)
+        await asyncio.sleep(retry_after)
+
+    # Callers don't use Telegram's response, so the body isn't decoded
+    response.raise_for_status()
+
+
+async def send_message_simple(chat_id: int, text: str) -> None:
     """
-    Send a message to a Telegram chat.
+    Send a plain text message to a Telegram chat.
+
+    Messages identical to one just sent to the same chat are dropped.
 
     Args:
         chat_id: The chat ID to send the message to
         text: The message text to send
-        parse_mode: Optional parse mode (e.g., "HTML", "Markdown")
-        reply_markup: Optional reply markup for inline keyboards
-
-    Returns:
-        dict: Response from Telegram API
 
     Raises:
         httpx.HTTPError: If the request fails
     """
-    telegram_api_url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
+    key = (chat_id, text)
+    if key in _recent_sends:
+        logger.debug("Dropped duplicate message to chat %s", chat_id)
+        return
+    _recent_sends[key] = True
+
+    payload = {"chat_id": chat_id, "text": text}
+    await _post("sendMessage", payload, chat_id=chat_id)
+
+
+def verify_secret_token(header: Optional[str]) -> bool:
+    """
+    Check a webhook's X-Telegram-Bot-Api-Secret-Token header in constant time.
+
+    Args:
+        header: The header value, or None if it was missing
+
+    Returns:
+        bool: True if it matches the configured secret token
+    """
+    return hmac.compare_digest((header or "").encode(), _SECRET_TOKEN_BYTES)
 
-    payload = request.model_dump(exclude_none=True)
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(telegram_api_url, json=payload)
-        response.raise_for_status()
-        return response.json()
+def _get_inner(update: dict) -> tuple[Optional[str], Optional[dict]]:
+    """Return the update type and its payload (message, callback query, ...)."""
+    for key in _UPDATE_KEYS:
+        inner = update.get(key)
+        if inner is not None:
+            return key, inner
+    return None, None
 
 
 def extract_chat_id_from_update(update: dict) -> Optional[int]:
@@ -47,14 +203,15 @@ def extract_chat_id_from_update(update: dict) -> Optional[int]:
     Returns:
         int: The chat_id if found, None otherwise
     """
-    if "message" in update:
-        return update["message"]["chat"]["id"]
-    elif "callback_query" in update:
-        return update["callback_query"]["message"]["chat"]["id"]
-    elif "edited_message" in update:
-        return update["edited_message"]["chat"]["id"]
-
-    return None
+    match update:
+        case {"message": {"chat": {"id": chat_id}}}:
+            return chat_id
+        case {"callback_query": {"message": {"chat": {"id": chat_id}}}}:
+            return chat_id
+        case {"edited_message": {"chat": {"id": chat_id}}}:
+            return chat_id
+        case _:
+            return None
 
 
 def extract_message_text_from_update(update: dict) -> Optional[str]:
@@ -67,22 +224,26 @@ def extract_message_text_from_update(update: dict) -> Optional[str]:
     Returns:
         str: The message text if found, empty string otherwise
     """
-    if "message" in update:
-        return update["message"].get("text", "")
-    elif "callback_query" in update:
-        return update["callback_query"].get("data", "")
-    elif "edited_message" in update:
-        return update["edited_message"].get("text", "")
-
-    return ""
-
-
-class UserInfo(BaseModel):
+    match update:
+        case {"message": message}:
+            return message.get("text") or ""
+        case {"callback_query": callback_query}:
+            return callback_query.get("data") or ""
+        case {"edited_message": message}:
+            return message.get("text") or ""
+        case _:
+            return ""
+
+
+# Telegram has already validated the update, so a plain slotted dataclass is
+# used instead of a Pydantic model
+@dataclass(slots=True, frozen=True)
+class UserInfo:
     user_id: int
     first_name: str
+    is_bot: bool
     last_name: Optional[str] = None
     username: Optional[str] = None
-    is_bot: bool
     language_code: Optional[str] = None
 
 
@@ -97,35 +258,27 @@ def extract_user_info_from_update(update: dict) -> Optional[UserInfo]:
         dict: User info containing firstname, username, user_id, and is_bot flag
               Returns None if user info cannot be extracted
     """
-    user_data = None
-
-    if "message" in update:
-        user_data = update["message"].get("from")
-    elif "callback_query" in update:
-        user_data = update["callback_query"].get("from")
-    elif "edited_message" in update:
-        user_data = update["edited_message"].get("from")
+    _, inner = _get_inner(update)
+    user_data = inner.get("from") if inner else None
 
     if not user_data:
         return None
 
-    return (
-        UserInfo(
-            user_id=user_data.get("id"),
-            first_name=user_data.get("first_name", "User"),  # firstname is always there
-            last_name=user_data.get("last_name"),  # Optional
-            username=user_data.get("username"),  # Optional
-            is_bot=user_data.get("is_bot", False),
-            language_code=user_data.get("language_code"),  # Optional
-        )
-        if user_data
-        else None
+    return UserInfo(
+        user_id=user_data["id"],
+        first_name=user_data.get("first_name", "User"),  # firstname is always there
+        is_bot=user_data.get("is_bot", False),
+        last_name=user_data.get("last_name"),  # Optional
+        username=user_data.get("username"),  # Optional
+        language_code=user_data.get("language_code"),  # Optional
     )
 
 
-async def get_telegram_file_url(file_id: str) -> str:
+async def get_telegram_file_url_cached(file_id: str) -> str:
     """
-    Get the public URL for a Telegram file using the bot token and file_id.
+    Get the public URL for a Telegram file, caching its file_path in Redis.
+
+    Only the file_path is cached so the bot token never ends up in Redis.
 
     Args:
         file_id: The Telegram file_id
@@ -136,18 +289,28 @@ async def get_telegram_file_url(file_id: str) -> str:
     Raises:
         httpx.HTTPError: If the request to Telegram API fails
     """
-    telegram_api_url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/getFile"
-    
-    async with httpx.AsyncClient() as client:
-        response = await client.get(telegram_api_url, params={"file_id": file_id})
-        response.raise_for_status()
-        result = response.json()
-        
-        if not result.get("ok"):
-            raise ValueError(f"Failed to get file info: {result}")
-        
-        file_path = result["result"]["file_path"]
-        return f"https://api.telegram.org/file/bot{TELEGRAM_BOT_TOKEN}/{file_path}"
+    key = f"tg:file:{file_id}"
+    cached = await redis_client.get(key)
+
+    if cached:
+        file_path = cached.decode()
+    else:
+        file_path = await _get_file_path(file_id)
+        await redis_client.set(key, file_path, ex=FILE_PATH_TTL)
+
+    return _FILE_DOWNLOAD_PREFIX + file_path
+
+
+async def _get_file_path(file_id: str) -> str:
+    """Resolve a file_id to its download path with the getFile method."""
+    response = await telegram_client.get(_METHOD_PATHS["getFile"], params={"file_id": file_id})
+    response.raise_for_status()
+    result = orjson.loads(response.content)
+
+    if not result.get("ok"):
+        raise ValueError(f"Failed to get file info: {result}")
+
+    return result["result"]["file_path"]
 
 
 def extract_photo_from_update(update: dict) -> Optional[dict]:
@@ -160,25 +323,16 @@ def extract_photo_from_update(update: dict) -> Optional[dict]:
     Returns:
         dict: Photo data with file_id and optional caption, or None if no photo found
     """
-    if "message" in update and "photo" in update["message"]:
-        # Telegram sends multiple photo sizes, get the largest one (last in array)
-        photos = update["message"]["photo"]
-        if photos:
-            largest_photo = photos[-1]
-            return {
-                "file_id": largest_photo["file_id"],
-                "caption": update["message"].get("caption"),
-            }
-    elif "edited_message" in update and "photo" in update["edited_message"]:
-        photos = update["edited_message"]["photo"]
-        if photos:
-            largest_photo = photos[-1]
-            return {
-                "file_id": largest_photo["file_id"],
-                "caption": update["edited_message"].get("caption"),
-            }
-    
-    return None
+    _, inner = _get_inner(update)
+    # Telegram sends multiple photo sizes, get the largest one (last in array)
+    photos = inner.get("photo") if inner else None
+    if not photos:
+        return None
+
+    return {
+        "file_id": photos[-1]["file_id"],
+        "caption": inner.get("caption"),
+    }
 
 
 def extract_document_from_update(update: dict) -> Optional[dict]:
@@ -192,24 +346,49 @@ def extract_document_from_update(update: dict) -> Optional[dict]:
         dict: Document data with file_id, file_name, mime_type and optional caption,
               or None if no document found
     """
-    if "message" in update and "document" in update["message"]:
-        document = update["message"]["document"]
-        return {
-            "file_id": document["file_id"],
-            "file_name": document.get("file_name", "document"),
-            "mime_type": document.get("mime_type", "application/octet-stream"),
-            "caption": update["message"].get("caption"),
-        }
-    elif "edited_message" in update and "document" in update["edited_message"]:
-        document = update["edited_message"]["document"]
-        return {
-            "file_id": document["file_id"],
-            "file_name": document.get("file_name", "document"),
-            "mime_type": document.get("mime_type", "application/octet-stream"),
-            "caption": update["edited_message"].get("caption"),
-        }
-    
-    return None
+    _, inner = _get_inner(update)
+    document = inner.get("document") if inner else None
+    if document is None:
+        return None
+
+    return {
+        "file_id": document["file_id"],
+        "file_name": document.get("file_name", "document"),
+        "mime_type": document.get("mime_type", "application/octet-stream"),
+        "caption": inner.get("caption"),
+    }
+
+
+@dataclass(slots=True)
+class UpdateView:
+    """The parts of a Telegram update the tasks need, extracted once."""
+
+    chat_id: Optional[int]
+    user_info: Optional[UserInfo]
+    text: str
+    photo: Optional[dict]
+    document: Optional[dict]
+
+
+def parse_update(update: dict) -> UpdateView:
+    """
+    Extract chat, user, text and media from a Telegram update in one go.
+
+    Args:
+        update: The Telegram update object
+
+    Returns:
+        UpdateView: The extracted fields; document is only set when the
+                    update has no photo, since photos take precedence
+    """
+    photo = extract_photo_from_update(update)
+    return UpdateView(
+        chat_id=extract_chat_id_from_update(update),
+        user_info=extract_user_info_from_update(update),
+        text=extract_message_text_from_update(update),
+        photo=photo,
+        document=None if photo else extract_document_from_update(update),
+    )
 
 
 def build_multimodal_input(
@@ -228,22 +407,16 @@ def build_multimodal_input(
     Returns:
         list: Multimodal input structure compatible with OpenAI Responses API
     """
-    content = []
-    
+    part_type, url_key = _FILE_PARTS[file_type]
+    file_part = {"type": part_type, url_key: file_url}
+
     # Add text if provided
-    if text:
-        content.append({"type": "input_text", "text": text})
-    
-    # Add file based on type
-    if file_type == "image":
-        content.append({"type": "input_image", "image_url": file_url})
-    else:  # file_type == "file"
-        content.append({"type": "input_file", "file_url": file_url})
-    
+    content = [{"type": "input_text", "text": text}, file_part] if text else [file_part]
+
     return [{"role": "user", "content": content}]
 
 
-def build_approval_keyboard(approval_id: str) -> dict:
+def build_approval_keyboard(approval_id: str) -> str:
     """
     Build inline keyboard with Approve/Reject buttons for human-in-the-loop approval.
 
@@ -251,16 +424,10 @@ def build_approval_keyboard(approval_id: str) -> dict:
         approval_id: Unique approval ID to include in callback data
 
     Returns:
-        dict: Inline keyboard markup for Telegram
+        str: JSON-serialized inline keyboard markup for Telegram (the Bot API
+             accepts reply_markup as a JSON string)
     """
-    return {
-        "inline_keyboard": [
-            [
-                {"text": "✅ Approve", "callback_data": f"approve:{approval_id}"},
-                {"text": "❌ Reject", "callback_data": f"reject:{approval_id}"}
-            ]
-        ]
-    }
+    return _APPROVAL_KEYBOARD_TEMPLATE.format(approval_id=approval_id)
 
 
 async def send_approval_request(
@@ -268,7 +435,7 @@ async def send_approval_request(
     tool_name: str, 
     arguments: Optional[str],
     approval_id: str
-) -> dict:
+) -> None:
     """
     Send approval request message with inline keyboard to user.
 
@@ -277,12 +444,7 @@ async def send_approval_request(
         tool_name: Name of the tool requiring approval
         arguments: Tool arguments (JSON string)
         approval_id: Unique approval ID
-
-    Returns:
-        dict: Response from Telegram API
     """
-    telegram_api_url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    
     # Format the approval message
     message = "🔐 **Approval Required**\n\n"
     message += f"Tool: `{tool_name}`\n"
@@ -296,31 +458,21 @@ async def send_approval_request(
         "parse_mode": "Markdown",
         "reply_markup": build_approval_keyboard(approval_id)
     }
-    
-    async with httpx.AsyncClient() as client:
-        response = await client.post(telegram_api_url, json=payload)
-        response.raise_for_status()
-        return response.json()
 
+    await _post("sendMessage", payload, chat_id=chat_id)
 
-async def answer_callback_query(callback_query_id: str, text: Optional[str] = None) -> dict:
+
+async def answer_callback_query(callback_query_id: str, text: Optional[str] = None) -> None:
     """
     Answer callback query to remove loading state from inline keyboard button.
 
     Args:
         callback_query_id: The callback query ID from Telegram
         text: Optional text to show as notification (not used if None)
-
-    Returns:
-        dict: Response from Telegram API
     """
-    telegram_api_url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/answerCallbackQuery"
-    
     payload = {"callback_query_id": callback_query_id}
     if text:
         payload["text"] = text
-    
-    async with httpx.AsyncClient() as client:
-        response = await client.post(telegram_api_url, json=payload)
-        response.raise_for_status()
-        return response.json()
+
+    # Callback answers don't count towards the message limits, so skip throttling
+    await _post("answerCallbackQuery", payload)
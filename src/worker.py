@@ -1,27 +1,77 @@
 """ARQ worker entry point for background task processing."""
 
-from src.config import REDIS_URL, get_arq_redis_settings
-from src.tasks.telegram_tasks import process_message_task, process_callback_query_task
+import logging
+
+from arq.worker import func
+
+from src.config import LOG_LEVEL, REDIS_URL, get_arq_redis_settings
+from src.database import create_tables
+from src.openai_client import openai_client
+from src.tasks.telegram_tasks import (
+    ingest_update_task,
+    process_message_task,
+    process_callback_query_task,
+)
+from src.utils.http_clients import (
+    close_http_clients,
+    telegram_client,
+    warm_http_clients,
+    weather_client,
+)
+from src.utils.logging_config import setup_logging
 from src.utils.redis_client import redis_client
 
+logger = logging.getLogger(__name__)
+
+# Jobs are I/O-bound (OpenAI, Telegram, Redis, Postgres); per-chat fairness is
+# enforced by the concurrency limiter in process_message_task
+MAX_JOBS = 100
+
+# One Redis connection per concurrent job plus headroom for ARQ's own polling,
+# health checks and job bookkeeping; a full pool raises "Too many connections",
+# so this is not capped by REDIS_MAX_CONNECTIONS (which sizes the API pools)
+REDIS_POOL_SIZE = MAX_JOBS + 6
+
+# Every task may run the agent (LLM calls, tools, guardrail), so none of them
+# is a sub-second job; 60s still covers a slow multi-tool run while letting
+# ARQ give up on a stuck job (and expire its in-progress key) sooner than 120s
+AGENT_TASK_TIMEOUT = 60
+
 
 async def on_startup(ctx: dict) -> None:
-    """Connect the Redis singleton used by state_manager on worker startup."""
-    print(f"🚀 ARQ worker starting - connecting to Redis at {REDIS_URL}")
-    await redis_client.connect(REDIS_URL)
+    """Set up logging, connect the Redis singleton used by state_manager, create the session tables and warm HTTP clients on worker startup."""
+    ctx["log_listener"] = setup_logging(LOG_LEVEL)
+    logger.info("🚀 ARQ worker starting - connecting to Redis at %s", REDIS_URL)
+    await redis_client.connect(REDIS_URL, max_connections=REDIS_POOL_SIZE)
+    await create_tables()
+    await warm_http_clients(weather_client, telegram_client)
 
 
 async def on_shutdown(ctx: dict) -> None:
-    """Disconnect Redis on worker shutdown."""
-    print("🛑 ARQ worker shutting down - disconnecting from Redis")
+    """Disconnect Redis and close shared HTTP clients on worker shutdown."""
+    logger.info("🛑 ARQ worker shutting down - disconnecting from Redis")
     await redis_client.disconnect()
+    await close_http_clients()
+    await openai_client.close()
+    ctx["log_listener"].stop()
 
 
 class WorkerSettings:
-    functions = [process_message_task, process_callback_query_task]
-    redis_settings = get_arq_redis_settings()
+    # process_message_task / process_callback_query_task stay registered so jobs
+    # enqueued by older API instances still run during a rolling deploy. They're
+    # wrapped here rather than in the tasks module (ingest_update_task calls
+    # process_message_task directly) and keep their coroutine names as job names
+    functions = [
+        func(ingest_update_task, timeout=AGENT_TASK_TIMEOUT),
+        func(process_message_task, timeout=AGENT_TASK_TIMEOUT),
+        func(process_callback_query_task, timeout=AGENT_TASK_TIMEOUT),
+    ]
+    redis_settings = get_arq_redis_settings(REDIS_POOL_SIZE)
     on_startup = on_startup
     on_shutdown = on_shutdown
-    max_jobs = 10
-    job_timeout = 120
+    max_jobs = MAX_JOBS
+    # ARQ polls its job queue; check every 100ms instead of the default 500ms
+    # so an idle worker picks up a new update sooner
+    poll_delay = 0.1
+    job_timeout = AGENT_TASK_TIMEOUT
     max_tries = 1